@@ -15,3 +15,6 @@ tar --lzip -xvf "$FILE"
 
 cd tzdb-$VERSION
 make TOPDIR=$INSTALL_PATH install
+
+# Pack the compiled zones into one archive, which puzzle19 reads in place of the installed tree
+tar -cf "$SCRIPT_DIR/zoneinfo-$VERSION.tar" -C "$INSTALL_PATH/usr/share/zoneinfo" .
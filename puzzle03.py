@@ -1,37 +1,124 @@
+import io
+import os
 import string
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from itertools import repeat
+from typing import Callable
 
 from unidecode import unidecode
 
+CHUNK_SIZE = 1 << 24  # Bytes of the password file each worker validates at a time
 
-def get_lines(filename):
-    with open(filename, encoding='utf-8') as f:
-        for line in f:
-            yield line.strip()
 
+def chunk_ranges(filename: str, chunk_size: int = CHUNK_SIZE) -> list[tuple[int, int]]:
+    """Split a file into byte ranges of roughly chunk_size, each ending at a line boundary"""
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        while boundaries[-1] + chunk_size < size:
+            f.seek(boundaries[-1] + chunk_size)
+            f.readline()
+            boundaries.append(f.tell())
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
 
-rules = [
-    # a length of at least 4 and at most 12
-    lambda line: 4 <= len(line) <= 12,
+
+def count_chunk(filename: str, start: int, end: int, check: Callable[[str], bool]) -> int:
+    """Count the valid passwords in one byte range of a file"""
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    # Split lines the same way as reading the file in text mode
+    return sum(1 for line in io.StringIO(text, newline=None) if check(line.strip()))
+
+
+def count_valid(
+        filename: str,
+        check: Callable[[str], bool],
+        workers: int | None = None,
+        chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """
+    Count the valid passwords in a file, validating chunks of it in parallel
+
+    :param filename: The password file, one per line
+    :param check: Module-level function that validates one password, so it can be sent to worker processes
+    :param workers: Number of worker processes, defaulting to one per core
+    :param chunk_size: Approximate number of bytes to validate per task
+    """
+    ranges = chunk_ranges(filename, chunk_size)
+    if len(ranges) <= 1:
+        return sum(count_chunk(filename, start, end, check) for start, end in ranges)
+    starts, ends = zip(*ranges)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(count_chunk, repeat(filename), starts, ends, repeat(check)))
+
+
+# Character classes, as bit flags
+DIGIT = 1 << 0
+UPPER = 1 << 1  # Uppercase letter, with or without accents
+LOWER = 1 << 2  # Lowercase letter, with or without accents
+VOWEL = 1 << 3  # Vowel, with or without accents
+CONSONANT = 1 << 4  # Consonant, with or without accents
+NON_ASCII = 1 << 5
+
+vowels = 'aeiouAEIOU'
+consonants = {letter for letter in string.ascii_letters if letter not in vowels}
+
+
+@cache
+def classify(ch: str) -> tuple[int, str]:
+    """
+    Classify a character, once per distinct character
+
+    :return: The character's class flags, and its unaccented form in lowercase
+    """
+    unaccented = unidecode(ch)
+    flags = 0
+    if ch in string.digits:
+        flags |= DIGIT
+    if any(c in string.ascii_uppercase for c in unaccented):
+        flags |= UPPER
+    if any(c in string.ascii_lowercase for c in unaccented):
+        flags |= LOWER
+    if any(c in vowels for c in unaccented):
+        flags |= VOWEL
+    if any(c in consonants for c in unaccented):
+        flags |= CONSONANT
+    if ord(ch) > 0b1111111:
+        flags |= NON_ASCII
+    return flags, unaccented.lower()
+
+
+# a length of at least 4 and at most 12
+min_length, max_length = 4, 12
+required = (
     # at least one digit
-    lambda line: any(ch in line for ch in string.digits),
+    DIGIT
     # at least one uppercase letter (with or without accents, examples: A or Ż)
-    lambda line: any(ch in unidecode(line) for ch in string.ascii_uppercase),
+    | UPPER
     # at least one lowercase letter (with or without accents, examples: a or ŷ)
-    lambda line: any(ch in unidecode(line) for ch in string.ascii_lowercase),
+    | LOWER
     # at least one character that is outside the standard 7-bit ASCII character set (examples: Ű, ù or ř)
-    lambda line: any(ord(ch) > 0b1111111 for ch in line),
-]
+    | NON_ASCII
+)
 
 
 def check_line(line):
-    for rule in rules:
-        if not rule(line):
-            return False
-    return True
+    if not min_length <= len(line) <= max_length:
+        return False
+    found = 0
+    for ch in line:
+        found |= classify(ch)[0]
+        if found & required == required:
+            return True
+    return False
 
 
-def solve(filename):
-    return [check_line(line) for line in get_lines(filename)].count(True)
+def solve(filename, workers: int | None = None):
+    return count_valid(filename, check_line, workers)
 
 
 if __name__ == '__main__':
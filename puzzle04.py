@@ -1,28 +1,61 @@
+import re
+from datetime import datetime
+from functools import cache
 from zoneinfo import ZoneInfo
 
-from pendulum import Duration
 from pendulum.parser import parse
 
+# The layout every timestamp in the input uses, like 'Mar 04, 2020, 10:00'
+timestamp_pattern = re.compile(r'([A-Z][a-z]{2}) (\d{1,2}), (\d{4}), (\d{1,2}):(\d{2})')
+months = {
+    month: i
+    for i, month in enumerate('Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec'.split(), start=1)
+}
+
+
+@cache
+def get_zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def parse_local(timestamp: str) -> datetime:
+    if match := timestamp_pattern.fullmatch(timestamp):
+        month, day, year, hour, minute = match.groups()
+        return datetime(int(year), months[month], int(day), int(hour), int(minute))
+    # Anything else goes through the much slower general-purpose parser
+    return parse(timestamp, strict=False).naive()
+
+
+def utc_seconds(local: datetime, zone: ZoneInfo) -> int:
+    """
+    Seconds since 1970 (UTC) of a wall-clock time in a zone
+
+    Skipped and repeated times are resolved to after the transition, the same way as pendulum:
+    that's the later of the two instants the time could mean.
+    """
+    return max(int(local.replace(tzinfo=zone, fold=fold).timestamp()) for fold in (0, 1))
+
+
+def parse_leg(line: str) -> int:
+    _, zone, timestamp = line.split(maxsplit=2)
+    return utc_seconds(parse_local(timestamp.rstrip()), get_zone(zone))
+
 
 def get_itineraries(filename):
+    """Yield the departure and arrival of each itinerary, in seconds since 1970, reading the file a line at a time"""
     with open(filename) as f:
-        itineraries = f.read().split('\n\n')
-    for itinerary in itineraries:
-        depart, arrive = itinerary.splitlines()
-        _, depart_zone, depart_time = depart.split(maxsplit=2)
-        departure = parse(depart_time, strict=False).naive().in_tz(depart_zone)
-        _, arrive_zone, arrive_time = arrive.split(maxsplit=2)
-        arrival = parse(arrive_time, strict=False).naive().in_tz(arrive_zone)
-        yield departure, arrival
+        legs = (parse_leg(line) for line in f if line.strip())
+        yield from zip(legs, legs)
 
 
 def solve(filename):
+    # Some historical offsets aren't whole minutes, so only round the total
     return int(sum(
-        (arrival-departure for departure, arrival in get_itineraries(filename)),
-        start=Duration()
-    ).total_minutes())
+        arrival - departure
+        for departure, arrival in get_itineraries(filename)
+    ) / 60)
 
 
 if __name__ == '__main__':
     assert solve('sample04.txt') == 3143
-    print(solve('day04.txt'))
\ No newline at end of file
+    print(solve('day04.txt'))
@@ -1,36 +1,82 @@
+from collections import defaultdict
+
+
 def load(filename):
     with open(filename) as f:
         words, puzzle = f.read().split('\n\n')
     return words.splitlines(), puzzle.splitlines()
 
 
-def fix_word_list(words):
-    def fix(word):
-        return word.encode('latin-1').decode('utf-8')
+def fix(text):
+    """Undo one round of UTF-8 being misread as Latin-1"""
+    return text.encode('latin-1').decode('utf-8')
 
-    for i, word in enumerate(words, start=1):
-        if i % 3 == 0:
-            word = fix(word)
-        if i % 5 == 0:
+
+def times_to_fix(i):
+    """How many times the ith word (counting from 1) was misencoded"""
+    return (i % 3 == 0) + (i % 5 == 0)
+
+
+def detect_and_fix(word):
+    """Keep undoing misencoding for as long as the word still looks like UTF-8 read as Latin-1"""
+    while not word.isascii():
+        try:
             word = fix(word)
-        yield word
+        except UnicodeError:
+            break
+    return word
 
 
-def solve(filename):
+def fix_word_list(words, auto_detect=False):
+    """
+    Repair the misencoded words in a word list
+
+    Words that need the same number of fixes are joined and repaired as one string, then split
+    apart again, rather than going through the codecs one at a time.
+
+    :param words: The word list
+    :param auto_detect: Work out from each word how many times it needs fixing, instead of from its position
+    """
+    if auto_detect:
+        return [detect_and_fix(word) for word in words]
+    groups = defaultdict(list)
+    for i in range(len(words)):
+        groups[times_to_fix(i + 1)].append(i)
+    fixed = list(words)
+    for times, indices in groups.items():
+        if not times:
+            continue
+        text = '\n'.join(words[i] for i in indices)
+        for _ in range(times):
+            text = fix(text)
+        for i, word in zip(indices, text.split('\n')):
+            fixed[i] = word
+    return fixed
+
+
+def solve(filename, auto_detect=False):
     words, puzzle = load(filename)
-    words = list(fix_word_list(words))
+    words = fix_word_list(words, auto_detect)
     return solve_puzzle(words, puzzle)
 
 
+def build_index(words):
+    """Map each (length, position, character) to the number of the first word that has it"""
+    index = {}
+    for i, word in enumerate(words, start=1):
+        length = len(word)
+        for position, ch in enumerate(word):
+            index.setdefault((length, position, ch), i)
+    return index
+
+
 def solve_puzzle(words, puzzle):
+    index = build_index(words)
     solution = 0
     for line in puzzle:
         length = len(line.strip())
         match_index, match_char = [(i, x) for i, x in enumerate(line.strip()) if x != '.'].pop()
-        solution += [
-            i for i, word in enumerate(words, start=1)
-            if len(word) == length and word[match_index] == match_char
-        ][0]
+        solution += index[length, match_index, match_char]
     return solution
 
 
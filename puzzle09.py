@@ -1,4 +1,7 @@
+import calendar
+import re
 from collections import defaultdict
+from functools import cache
 
 import pendulum
 
@@ -10,26 +13,46 @@ def load(filename):
             yield date, names.split(', ')
 
 
+date_pattern = re.compile(r'(\d{1,2})-(\d{1,2})-(\d{1,2})')
+# Which of the three fields holds the year, month and day in each format
+field_orders = {
+    'YY-MM-DD': (0, 1, 2),
+    'YY-DD-MM': (0, 2, 1),
+    'DD-MM-YY': (2, 1, 0),
+    'MM-DD-YY': (2, 0, 1),
+}
+
+
+def is_valid_date(yy: int, month: int, day: int) -> bool:
+    # Two-digit years are read the same way as pendulum does
+    year = 2000 + yy if yy <= 68 else 1900 + yy
+    return 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]
+
+
+@cache
+def valid_formats(date_string: str) -> frozenset[str]:
+    """The formats a date string could be in, worked out once per distinct string"""
+    match = date_pattern.fullmatch(date_string)
+    if not match:
+        return frozenset()
+    fields = tuple(map(int, match.groups()))
+    return frozenset(
+        format_
+        for format_, (year, month, day) in field_orders.items()
+        if is_valid_date(fields[year], fields[month], fields[day])
+    )
+
+
 def solve(filename):
     data = list(load(filename))
-    formats = {'YY-MM-DD', 'YY-DD-MM', 'DD-MM-YY', 'MM-DD-YY'}
+    formats = set(field_orders)
     options = defaultdict(formats.copy)
     entries = defaultdict(set)
 
-    def check_format(data_string, format_):
-        try:
-            pendulum.from_format(data_string, format_)
-        except ValueError:
-            return False
-        return True
-
     for date, names in data:
-        valid_formats = {
-            f for f in formats
-            if check_format(date, f)
-        }
+        valid = valid_formats(date)
         for name in names:
-            options[name] &= valid_formats
+            options[name] &= valid
             entries[name].add(date)
     user_formats = {
         name: list(opts)[0]
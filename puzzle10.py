@@ -1,7 +1,11 @@
-from collections import defaultdict
+import sys
+from argparse import ArgumentParser
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Executor, FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import timedelta
-from itertools import product
-from time import time
+from itertools import islice, product
+from time import sleep, time
+import sqlite3
 
 import bcrypt
 import unicodedata
@@ -15,44 +19,387 @@ def load(filename):
     return users, attempts
 
 
-def all_encodings(pw: str):
-    characters = [
-        {
-            unicodedata.normalize('NFC', c).encode(),
-            unicodedata.normalize('NFD', c).encode(),
-        } for c in pw
-    ]
-    yield from (b''.join(encoding) for encoding in product(*characters))
+def read_database(f) -> dict[bytes, bytes]:
+    """Read the user database from the start of a binary stream, up to the blank line"""
+    users = {}
+    for line in f:
+        if not line.strip():
+            break
+        name, hashed = line.split()
+        users[name] = hashed
+    return users
 
 
-def solve(filename):
-    db, attempts = load(filename)
+def read_attempts(f, follow: bool = False, poll_interval: float = 1.0):
+    """
+    Yield each (user, password) attempt from a binary stream, one line at a time
+
+    While following a stream, None is yielded each time there is nothing new to read,
+    so the caller can get on with other work before the next poll.
+
+    :param f: The stream, already positioned after the user database
+    :param follow: Keep waiting for new lines at the end of the stream, like ``tail -f``
+    :param poll_interval: Seconds to wait before checking a followed stream again
+    """
+    pending = b''
+    while True:
+        line = f.readline()
+        if not line:
+            if not follow:
+                break
+            yield None
+            sleep(poll_interval)
+            continue
+        pending += line
+        if not pending.endswith(b'\n') and follow:
+            # Wait for the writer to finish the line
+            continue
+        if pending.strip():
+            yield pending.split()
+        pending = b''
+
+
+class LRUCache(OrderedDict):
+    """Mapping that forgets its least recently used entries once it holds more than maxsize"""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+def all_encodings(pw: str, limit: int | None = None):
+    """
+    Generate each distinct byte encoding of a password, mixing NFC and NFD per character
+
+    The whole-string NFC and NFD forms are the most likely, so they come first.
+
+    :param pw: The password
+    :param limit: Maximum number of candidates to generate
+    """
+    return islice(_all_encodings(pw), limit)
+
+
+def _all_encodings(pw: str):
+    characters = []
+    for c in pw:
+        nfc = unicodedata.normalize('NFC', c).encode()
+        nfd = unicodedata.normalize('NFD', c).encode()
+        characters.append((nfc, nfd) if nfc != nfd else (nfc,))
+    yield b''.join(options[0] for options in characters)
+    if all(len(options) == 1 for options in characters):
+        return
+    yield b''.join(options[-1] for options in characters)
+    # product() starts with all-NFC and ends with all-NFD, which are already done
+    mixed = islice(product(*characters), 1, None)
+    previous = next(mixed, None)
+    for encoding in mixed:
+        yield b''.join(previous)
+        previous = encoding
+
+
+def check_password(option: bytes, hashed: bytes) -> bool:
+    # Module-level so it can be pickled for a ProcessPoolExecutor
+    return bcrypt.checkpw(option, hashed)
+
+
+def verify_attempts(db, attempts, pool: Executor, max_candidates: int | None = None):
+    """
+    Check every distinct (user, password) pair against the database using a worker pool
+
+    Each candidate encoding is its own task. As soon as one matches, every other
+    outstanding candidate for that user is cancelled, since a user only has one password.
+
+    :param db: Mapping of user to bcrypt hash
+    :param attempts: (user, NFC-normalized password) pairs
+    :param pool: Executor to run the bcrypt checks on
+    :param max_candidates: Maximum number of encodings to try per password
+    :return: The cache of correct passwords and the bad_cache of rejected ones, by user.
+        A password only counts as rejected once every one of its encodings was tried,
+        or once another password for the same user matched.
+    """
     cache = {}
     bad_cache = defaultdict(set)
+    owners = {}
+    outstanding = defaultdict(lambda: defaultdict(set))
+    truncated = set()
+    for name, text in dict.fromkeys(attempts):
+        # One extra candidate shows whether the cap cut any off
+        limit = None if max_candidates is None else max_candidates + 1
+        options = list(all_encodings(text, limit))
+        if max_candidates is not None and len(options) > max_candidates:
+            truncated.add((name, text))
+            del options[max_candidates:]
+        for option in options:
+            future = pool.submit(check_password, option, db[name])
+            owners[future] = name, text
+            outstanding[name][text].add(future)
+
+    while owners:
+        done, _ = wait(owners, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future not in owners:
+                # Cancelled by a sibling that finished in the same batch
+                continue
+            name, text = owners.pop(future)
+            user_outstanding = outstanding[name]
+            user_outstanding[text].discard(future)
+            if future.result():
+                cache[name] = text
+                for other_text, siblings in user_outstanding.items():
+                    if other_text != text:
+                        bad_cache[name].add(other_text)
+                    for sibling in siblings:
+                        sibling.cancel()
+                        owners.pop(sibling, None)
+                del outstanding[name]
+            elif not user_outstanding[text]:
+                del user_outstanding[text]
+                if (name, text) not in truncated:
+                    bad_cache[name].add(text)
+    return cache, bad_cache
+
+
+class CredentialCache:
+    """
+    On-disk record of bcrypt verdicts, keyed by user, stored hash and NFC password
+
+    Entries for a user are dropped once their hash in the database changes, and the
+    least recently used entries are evicted once there are more than max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS verdicts (
+                user BLOB NOT NULL,
+                hash BLOB NOT NULL,
+                password TEXT NOT NULL,
+                valid INTEGER NOT NULL,
+                used REAL NOT NULL,
+                PRIMARY KEY (user, hash, password)
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS verdicts_used ON verdicts (used)')
+
+    def close(self):
+        self.conn.close()
+
+    def invalidate(self, db):
+        """Forget every verdict made against a hash that is no longer in the database"""
+        with self.conn:
+            self.conn.executemany(
+                'DELETE FROM verdicts WHERE user = ? AND hash != ?',
+                db.items(),
+            )
+
+    def lookup(self, db, attempts) -> dict[tuple[bytes, str], bool]:
+        """Return the known verdicts for any of the (user, password) attempts"""
+        known = {}
+        now = time()
+        with self.conn:
+            for name, text in attempts:
+                row = self.conn.execute(
+                    'SELECT valid FROM verdicts WHERE user = ? AND hash = ? AND password = ?',
+                    (name, db[name], text),
+                ).fetchone()
+                if row is not None:
+                    known[name, text] = bool(row[0])
+            self.conn.executemany(
+                'UPDATE verdicts SET used = ? WHERE user = ? AND hash = ? AND password = ?',
+                ((now, name, db[name], text) for name, text in known),
+            )
+        return known
+
+    def store(self, db, cache, bad_cache):
+        """Record fresh verdicts, then evict the least recently used beyond max_entries"""
+        now = time()
+        rows = [(name, db[name], text, True, now) for name, text in cache.items()]
+        rows += [
+            (name, db[name], text, False, now)
+            for name, texts in bad_cache.items()
+            for text in texts
+        ]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)', rows)
+            (count,), = self.conn.execute('SELECT COUNT(*) FROM verdicts')
+            if count > self.max_entries:
+                self.conn.execute(
+                    'DELETE FROM verdicts WHERE rowid IN (SELECT rowid FROM verdicts ORDER BY used LIMIT ?)',
+                    (count - self.max_entries,),
+                )
+
+
+def solve(
+        filename,
+        workers: int | None = None,
+        executor: type[Executor] = ThreadPoolExecutor,
+        cache_path: str | None = None,
+        max_candidates: int | None = None,
+):
+    db, attempts = load(filename)
+    attempts = [
+        (name, unicodedata.normalize('NFC', entry.decode()))
+        for name, entry in attempts
+    ]
+    distinct = list(dict.fromkeys(attempts))
+    store = None
+    known = {}
+    if cache_path:
+        store = CredentialCache(cache_path)
+        store.invalidate(db)
+        known = store.lookup(db, distinct)
+    cache = {name: text for (name, text), valid in known.items() if valid}
+    unknown = [
+        (name, text)
+        for name, text in distinct
+        if (name, text) not in known and name not in cache
+    ]
+    # bcrypt releases the GIL, so threads are enough to use every core
+    with executor(max_workers=workers) as pool:
+        new_cache, bad_cache = verify_attempts(db, unknown, pool, max_candidates)
+    if store:
+        store.store(db, new_cache, bad_cache)
+        store.close()
+    cache |= new_cache
+    return sum(1 for name, text in attempts if cache.get(name) == text)
+
+
+def first_match(futures) -> bool:
+    """Wait for candidate checks until one matches, then cancel the rest"""
+    for future in as_completed(futures):
+        if not future.cancelled() and future.result():
+            for other in futures:
+                other.cancel()
+            return True
+    return False
+
+
+def stream_solve(
+        f,
+        workers: int | None = None,
+        executor: type[Executor] = ThreadPoolExecutor,
+        follow: bool = False,
+        cache_size: int = 100_000,
+        bad_cache_size: int = 1_000_000,
+        max_candidates: int | None = None,
+        window: int = 64,
+):
+    """
+    Audit a binary stream of attempts line by line, with bounded memory
+
+    Up to window unknown attempts are verified at once so the pool stays busy, but
+    attempts are still resolved, and counted, in the order they appear.
+
+    :param f: Binary stream holding the user database, a blank line, then the attempts
+    :param follow: Keep waiting for more attempts at the end of the stream
+    :param cache_size: Maximum number of users to remember the correct password for
+    :param bad_cache_size: Maximum number of rejected (user, password) pairs to remember
+    :param max_candidates: Maximum number of encodings to try per password
+    :param window: Maximum number of distinct attempts being verified at once
+    :return: Generator of the running (valid attempts, total attempts) counts
+    """
+    db = read_database(f)
+    cache = LRUCache(cache_size)
+    bad_cache = LRUCache(bad_cache_size)
+    in_flight = {}
+    pending = deque()
     valid_attempts = 0
-    checks = 0
-    for name, entry in attempts:
-        text: str = unicodedata.normalize('NFC', entry.decode())
+    total_attempts = 0
+
+    def submit(name, text):
+        return [
+            pool.submit(check_password, option, db[name])
+            for option in all_encodings(text, max_candidates)
+        ]
+
+    def resolve():
+        nonlocal valid_attempts, total_attempts
+        name, text, futures = pending.popleft()
+        in_flight.pop((name, text), None)
+        total_attempts += 1
         if name in cache:
-            if cache[name] == text:
-                valid_attempts += 1
-            continue
-        if text in bad_cache[name]:
-            continue
-        for option in all_encodings(text):
-            checks += 1
-            if bcrypt.checkpw(option, db[name]):
-                cache[name] = text
-                valid_attempts += 1
-                break
+            valid = cache[name] == text
+        elif (name, text) in bad_cache:
+            valid = False
         else:
-            bad_cache[name].add(text)
-    return valid_attempts
+            # Known when queued, but evicted from the caches since
+            valid = first_match(futures or submit(name, text))
+        if valid:
+            cache[name] = text
+            valid_attempts += 1
+        else:
+            bad_cache[name, text] = True
+        for future in futures or ():
+            future.cancel()
+
+    def ready():
+        futures = pending[0][2]
+        return futures is None or all(future.done() for future in futures)
+
+    with executor(max_workers=workers) as pool:
+        for attempt in read_attempts(f, follow):
+            if attempt is None:
+                # The stream is idle, so count whatever has finished verifying in the meantime
+                while pending and ready():
+                    resolve()
+                    yield valid_attempts, total_attempts
+                continue
+            name, entry = attempt
+            text: str = unicodedata.normalize('NFC', entry.decode())
+            if name in cache or (name, text) in bad_cache:
+                futures = None
+            elif (name, text) in in_flight:
+                futures = in_flight[name, text]
+            else:
+                futures = in_flight[name, text] = submit(name, text)
+            pending.append((name, text, futures))
+            # Keep the queue bounded, even while its head is slow to verify
+            while pending and (len(in_flight) >= window or len(pending) >= 8 * window or ready()):
+                resolve()
+                yield valid_attempts, total_attempts
+        while pending:
+            resolve()
+            yield valid_attempts, total_attempts
 
 
 if __name__ == '__main__':
+    parser = ArgumentParser(description='Count the valid login attempts in a puzzle 10 log')
+    parser.add_argument('path', nargs='?', help='Attempt log to stream, or - for stdin')
+    parser.add_argument('--follow', action='store_true', help='Keep waiting for new attempts')
+    parser.add_argument('--workers', type=int, help='Number of bcrypt workers')
+    parser.add_argument('--max-candidates', type=int, help='Maximum encodings to try per password')
+    args = parser.parse_args()
+    if args.path:
+        # Stream an attempt log, e.g. `python puzzle10.py - < day10.txt`
+        stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+        last_report = 0
+        valid = total = 0
+        with stream:
+            for valid, total in stream_solve(
+                    stream,
+                    workers=args.workers,
+                    follow=args.follow,
+                    max_candidates=args.max_candidates,
+            ):
+                if time() - last_report >= 0.5:
+                    print(f'\r{valid} valid of {total} attempts', end='', file=sys.stderr)
+                    last_report = time()
+        print(f'\r{valid} valid of {total} attempts', file=sys.stderr)
+        sys.exit()
     assert solve('sample10.txt') == 4
     before = time()
-    print(solve('day10.txt'))
+    print(solve('day10.txt', cache_path='day10.sqlite'))
     after = time()
-    print('Elapsed time:', timedelta(seconds=after-before))
\ No newline at end of file
+    print('Elapsed time:', timedelta(seconds=after-before))
@@ -1,3 +1,6 @@
+import re
+
+
 def load(filename):
     with open(filename) as f:
         for line in f:
@@ -19,25 +22,38 @@ odysseus = {
 }
 
 
-def shift(text, n):
+def shift_table(n):
     shifted_upper = greek_upper[n:] + greek_upper[:n]
     shifted_lower = greek_lower[n:] + greek_lower[:n]
-    mapping = dict(zip(
-        [*greek_upper, *greek_lower],
-        [*shifted_upper, *shifted_lower]
-    ))
-    return ''.join(
-        mapping.get(ch, ch)
-        for ch in normalize_sigma(text)
-    )
+    return str.maketrans(greek_upper + greek_lower, shifted_upper + shifted_lower)
+
+
+shift_tables = [shift_table(n) for n in range(len(greek_upper))]
+
+
+def shift(text, n):
+    return normalize_sigma(text).translate(shift_tables[n % len(greek_upper)])
+
+
+# Every form of the name as it appears in a line that has to be shifted by n to read it.
+# Filled from the largest shift down, so the smallest shift wins if two ever coincide.
+encoded_odysseus = {
+    shift(o, -n): n
+    for n in range(24, 0, -1)
+    for o in odysseus
+}
+# Lookahead so overlapping matches are all found, with the smallest shifts tried first at each position
+odysseus_pattern = re.compile('(?=({}))'.format('|'.join(
+    map(re.escape, sorted(encoded_odysseus, key=encoded_odysseus.get))
+)))
 
 
 def find_odysseus(line):
-    for i in range(1, 25):
-        shifted = shift(line, i)
-        if any(o in shifted for o in odysseus):
-            return i
-    return 0
+    """Find the smallest shift that reveals Odysseus in a line, searching for every shifted form at once"""
+    return min(
+        (encoded_odysseus[match.group(1)] for match in odysseus_pattern.finditer(normalize_sigma(line))),
+        default=0,
+    )
 
 
 def solve(filename):
@@ -1,6 +1,6 @@
+import random
 import string
 import unicodedata
-from itertools import count
 
 from unidecode import unidecode
 
@@ -14,54 +14,103 @@ def load(filename):
         return list(map(parse_line, f.read().splitlines()))
 
 
-alphabet = dict(zip(string.ascii_uppercase, count(1)))
-alphabet['Å'] = 27
-alphabet['Ä'] = alphabet['Æ'] = 28
-alphabet['Ö'] = alphabet['Ø'] = 29
+class CollationTable(dict):
+    """Translation table from a character to its sort weights, filled in the first time each character is seen"""
 
-# Normalize unicode in lookup
-alphabet = {
-    unicodedata.normalize('NFC', k): v
-    for k, v in alphabet.items()
-}
+    def __init__(self, collation):
+        super().__init__()
+        self.collation = collation
+
+    def __missing__(self, codepoint):
+        weights = self[codepoint] = self.collation.weigh(chr(codepoint))
+        return weights
+
+
+class Collation:
+    """
+    A locale's alphabetical order, declared as data
+
+    Sort keys are byte strings of letter weights, made with a single str.translate over the name.
+    """
+
+    def __init__(self, letters: list[str], unknown_last: bool = False, skip_particles: bool = False):
+        """
+        :param letters: The alphabet in order. All letters in one string sort the same, like 'ÄÆ' in Swedish
+        :param unknown_last: Sort letters and digits that aren't in the alphabet, even unaccented, after it instead of ignoring them
+        :param skip_particles: Ignore the lowercase particles at the start of a surname, like the Dutch 'van' or 'de'
+        """
+        self.weights = {
+            unicodedata.normalize('NFC', letter): chr(weight)
+            for weight, group in enumerate(letters, start=1)
+            for letter in group
+        }
+        self.unknown = chr(len(letters) + 1) if unknown_last else ''
+        self.skip_particles = skip_particles
+        self.table = CollationTable(self)
+
+    def weigh(self, ch: str) -> str:
+        """The weights of one uppercase character: its own, or else those of its unaccented form"""
+        if ch in self.weights:
+            return self.weights[ch]
+        if not ch.isalnum():
+            return ''
+        return ''.join(self.weights.get(letter, '') for letter in unidecode(ch).upper()) or self.unknown
+
+    def key(self, value) -> bytes:
+        name, _ = value
+        if self.skip_particles:
+            name = name[next(i for i, ch in enumerate(name) if ch == ch.upper() and ch.isalnum()):]
+        return unicodedata.normalize('NFC', name).upper().translate(self.table).encode('latin-1')
+
+
+english = Collation([*string.ascii_uppercase])
+swedish = Collation([*string.ascii_uppercase, 'Å', 'ÄÆ', 'ÖØ'], unknown_last=True)
+dutch = Collation([*string.ascii_uppercase], skip_particles=True)
+locales = [english, swedish, dutch]
+
+
+def collation_keys(value):
+    """The sort keys for a name in every locale, all computed together"""
+    return tuple(locale.key(value) for locale in locales)
 
 
 def english_key(value):
-    name, _ = value
-    decoded = unidecode(name).upper()
-    return [ch for ch in decoded if ch in string.ascii_uppercase]
+    return english.key(value)
 
 
 def swedish_key(value):
-    name, _ = value
-    indices = [
-        alphabet.get(letter) or alphabet.get(unidecode(letter)) or f'WHERE IS {letter}?'
-        for letter in unicodedata.normalize('NFC', name).upper()
-        if letter.isalnum()
-    ]
-    return indices
+    return swedish.key(value)
 
 
 def dutch_key(value):
-    name, number = value
-    first_upper = next(i for i, ch in enumerate(name) if ch == ch.upper() and ch.isalnum())
-    return english_key((name[first_upper:], number))
+    return dutch.key(value)
+
+
+def select(items, k):
+    """Find the kth smallest of some distinct items in expected linear time, without sorting them"""
+    while True:
+        pivot = random.choice(items)
+        lower = [item for item in items if item < pivot]
+        if k < len(lower):
+            items = lower
+            continue
+        upper = [item for item in items if item > pivot]
+        if k >= len(items) - len(upper):
+            k -= len(items) - len(upper)
+            items = upper
+            continue
+        return pivot
 
 
 def solve(filename):
     names = load(filename)
     middle_index = len(names) // 2
+    keys = [collation_keys(value) for value in names]
     result = 1
-    for sort_key in (english_key, swedish_key, dutch_key):
-        # print(sort_key.__name__)
-        sort_names = sorted(names, key=sort_key)
-        # for i, (name, value) in enumerate(sort_names):
-        #     if i == middle_index:
-        #         print('* ', end='')
-        #     else:
-        #         print('  ', end='')
-        #     print(name, value)
-        result *= sort_names[middle_index][-1]
+    for locale in range(len(locales)):
+        # The position breaks ties, so this matches what a stable sort would put in the middle
+        _, i = select([(key[locale], i) for i, key in enumerate(keys)], middle_index)
+        result *= names[i][-1]
     return result
 
 
@@ -1,4 +1,4 @@
-from itertools import batched
+from functools import cache
 
 from puzzle06 import solve_puzzle
 
@@ -6,10 +6,7 @@ bytestring = '616e77c3a4686c65'
 
 
 def str2bytes(s):
-    return bytes(
-        int(''.join(b), 16)
-        for b in batched(bytestring, 2)
-    )
+    return bytes.fromhex(s)
 
 
 value = str2bytes(bytestring)
@@ -18,35 +15,56 @@ value = str2bytes(bytestring)
 def load(filename):
     with open(filename) as f:
         words, puzzle = f.read().split('\n\n')
-    encoded_words = [
-        bytes(
-            int(''.join(b), 16)
-            for b in batched(line.strip(), 2)
-        )
-        for line in words.splitlines()
-    ]
+    lines = [line.strip() for line in words.splitlines()]
+    # Decode the whole word list in one go, then cut it back up into words
+    data = bytes.fromhex(''.join(lines))
+    encoded_words = []
+    start = 0
+    for line in lines:
+        end = start + len(line) // 2
+        encoded_words.append(data[start:end])
+        start = end
     return encoded_words, puzzle.splitlines()
 
 
+def likely_encodings(word):
+    """Guess the encodings a word is most likely to be in from its BOM or the pattern of its null bytes"""
+    if word[:3] == b'\xef\xbb\xbf':
+        return ('utf-8-sig',)
+    if word[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return ('utf-16',)
+    if len(word) % 2 == 0 and b'\x00' in word:
+        # Latin characters in UTF-16 have a null high byte
+        if b'\x00' not in word[::2]:
+            return ('utf-16-le',)
+        if b'\x00' not in word[1::2]:
+            return ('utf-16-be',)
+    if not word.isascii():
+        return ('utf-8',)
+    return ()
+
+
+@cache
+def decode_word(word):
+    has_bom = word[:2] in (b'\xff\xfe', b'\xfe\xff')
+    if has_bom:
+        encodings = ('utf-8-sig', 'utf-16')
+    else:
+        encodings = ('latin-1', 'utf-8', 'utf-8-sig', 'utf-16-le', 'utf-16-be')
+
+    for encoding in dict.fromkeys(likely_encodings(word) + encodings):
+        try:
+            decoded = word.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        if decoded.isalnum() and all(ord(ch) < 0x24f for ch in decoded):  # 0x24F is the end of the latin unicode range
+            return decoded
+    orig_line = ''.join(hex(ch + 0xf00)[3:] for ch in word)
+    print(f"Couldn't decode {orig_line}")
+
+
 def solve(filename):
     encoded_words, puzzle = load(filename)
-
-    def decode_word(word):
-        has_bom = word[:2] in (b'\xff\xfe', b'\xfe\xff')
-        if has_bom:
-            encodings = ('utf-8-sig', 'utf-16')
-        else:
-            encodings = ('latin-1', 'utf-8', 'utf-8-sig', 'utf-16-le', 'utf-16-be')
-
-        for encoding in encodings:
-            try:
-                decoded = word.decode(encoding)
-            except UnicodeDecodeError:
-                continue
-            if decoded.isalnum() and all(ord(ch) < 0x24f for ch in decoded):  # 0x24F is the end of the latin unicode range
-                return decoded
-        orig_line = ''.join(hex(ch + 0xf00)[3:] for ch in word)
-        print(f"Couldn't decode {orig_line}")
     words = [decode_word(w) for w in encoded_words]
     # From here, it's just puzzle 6 again
     return solve_puzzle(words, puzzle)
@@ -1,16 +1,18 @@
 from datetime import date
+from functools import cache
 from textwrap import dedent
 from typing import Iterable
 
 import dateutil.parser
+import numpy as np
 from pendulum import Date, Interval, WeekDay, DateTime, Time, Timezone, UTC
 
 
 class Office:
-    def __init__(self, name: str, tz_name: str, holidays: list[date]):
+    def __init__(self, name: str, tz_name: str, holidays: Iterable[date]):
         self.name = name
         self.tz = tz_name
-        self.holidays = holidays
+        self.holidays = frozenset(holidays)
 
     def __str__(self):
         return self.name
@@ -26,27 +28,37 @@ class Office:
         return cls(name, tz, holidays)
 
     def open_times(self, year: int, day_start, day_end):
-        weekdays = [
-            WeekDay.MONDAY,
-            WeekDay.TUESDAY,
-            WeekDay.WEDNESDAY,
-            WeekDay.THURSDAY,
-            WeekDay.FRIDAY,
-        ]
-        jan1 = Date(year, 1, 1)
-        start = jan1.subtract(days=1)
-        end = jan1.add(years=1)
-        days = (
-            d
-            for d in Interval(start, end).range('days')
-            if d.day_of_week in weekdays and d not in self.holidays
+        yield from open_intervals(self.tz, self.holidays, year, day_start, day_end)
+
+
+weekdays = {
+    WeekDay.MONDAY,
+    WeekDay.TUESDAY,
+    WeekDay.WEDNESDAY,
+    WeekDay.THURSDAY,
+    WeekDay.FRIDAY,
+}
+
+
+@cache
+def open_intervals(tz_name: str, holidays: frozenset[date], year: int, day_start: Time, day_end: Time) -> tuple[Interval, ...]:
+    """
+    Opening hours in UTC for every working day around a year
+
+    Cached, so offices and clients that share a timezone and holiday calendar share one schedule.
+    """
+    jan1 = Date(year, 1, 1)
+    start = jan1.subtract(days=1)
+    end = jan1.add(years=1)
+    tz = Timezone(tz_name)
+    return tuple(
+        Interval(
+            DateTime.combine(day, day_start, tzinfo=tz).in_tz(UTC),
+            DateTime.combine(day, day_end, tzinfo=tz).in_tz(UTC),
         )
-        days = list(days)
-        tz = Timezone(self.tz)
-        for day in days:
-            start = DateTime.combine(day, day_start, tzinfo=tz)
-            end = DateTime.combine(day, day_end, tzinfo=tz)
-            yield Interval(start, end)
+        for day in Interval(start, end).range('days')
+        if day.day_of_week in weekdays and day not in holidays
+    )
 
 
 class Client(Office):
@@ -85,69 +97,118 @@ def load(filename):
     return offices, customers
 
 
-def solve(filename):
-    offices, customers = load(filename)
-    year_start = DateTime(2022, 1, 1, tzinfo=UTC)
-    year_end = DateTime(2023, 1, 1, tzinfo=UTC)
-    num_blocks: int = int((year_end - year_start).total_minutes() // 30)
-    covered_time_blocks = [False] * num_blocks
-    office_time_blocks = {
-        office: covered_time_blocks.copy()
-        for office in offices + customers
-    }
+class CoverageIndex:
+    """
+    Half-hour coverage of a year for every office and client
+
+    Prefix sums over the slots answer range queries in constant time, so any number of
+    questions can be asked of a schedule without filling it in again.
+    """
+    BLOCK_MINUTES = 30
 
-    def time_block(dt: DateTime):
-        offset = int(max((dt - year_start).total_minutes(), 0))
-        return offset // 30
-
-    for office in offices:
-        for time_range in office.open_times(2022, day_start=Time(8, 30), day_end=Time(17)):
-            start = time_block(time_range.start)
-            end = time_block(time_range.end)
-            if end:
-                for i in range(start, end):
-                    covered_time_blocks[i] = True
-                    office_time_blocks[office][i] = True
-    for customer in customers:
-        for time_range in customer.open_times(2022, day_start=Time(), day_end=Time().subtract(microseconds=1)):
-            start = time_block(time_range.start)
-            end = time_block(time_range.end)
-            if end:
-                for i in range(start, end + 1):
-                    office_time_blocks[customer][i] = True
-
-    def print_coverage(d: Date):
+    def __init__(self, offices: list[Office], customers: list[Client], year: int = 2022):
+        self.offices = offices
+        self.customers = customers
+        self.year_start = DateTime(year, 1, 1, tzinfo=UTC)
+        year_end = DateTime(year + 1, 1, 1, tzinfo=UTC)
+        self.num_blocks: int = int((year_end - self.year_start).total_minutes() // self.BLOCK_MINUTES)
+        self.covered_time_blocks = np.zeros(self.num_blocks, dtype=bool)
+        self.office_time_blocks = {
+            office: np.zeros(self.num_blocks, dtype=bool)
+            for office in offices + customers
+        }
+
+        for office in offices:
+            for time_range in office.open_times(year, day_start=Time(8, 30), day_end=Time(17)):
+                start = self.time_block(time_range.start)
+                end = self.time_block(time_range.end)
+                if end:
+                    self.office_time_blocks[office][start:end] = True
+            self.covered_time_blocks |= self.office_time_blocks[office]
+        for customer in customers:
+            for time_range in customer.open_times(year, day_start=Time(), day_end=Time().subtract(microseconds=1)):
+                start = self.time_block(time_range.start)
+                end = self.time_block(time_range.end)
+                if end:
+                    self.office_time_blocks[customer][start:end + 1] = True
+
+        # Entry i is the number of slots before slot i, so any range is a single subtraction
+        self.open_totals = {
+            office: self.prefix_sums(blocks)
+            for office, blocks in self.office_time_blocks.items()
+        }
+        self.covered_totals = self.prefix_sums(self.covered_time_blocks)
+        self.uncovered_totals = {
+            customer: self.prefix_sums(self.office_time_blocks[customer] & ~self.covered_time_blocks)
+            for customer in customers
+        }
+
+    @staticmethod
+    def prefix_sums(blocks: np.ndarray) -> np.ndarray:
+        return np.concatenate(([0], np.cumsum(blocks, dtype=np.int64)))
+
+    def time_block(self, dt: DateTime) -> int:
+        offset = int(max((dt - self.year_start).total_minutes(), 0))
+        return min(offset // self.BLOCK_MINUTES, self.num_blocks)
+
+    def _minutes(self, totals: np.ndarray, start: DateTime | None, end: DateTime | None) -> int:
+        first = 0 if start is None else self.time_block(start)
+        last = self.num_blocks if end is None else self.time_block(end)
+        if last <= first:
+            return 0
+        return self.BLOCK_MINUTES * int(totals[last] - totals[first])
+
+    def open_minutes(self, office: Office, start: DateTime | None = None, end: DateTime | None = None) -> int:
+        """Minutes an office is open (or a client needs support) between two UTC instants"""
+        return self._minutes(self.open_totals[office], start, end)
+
+    def covered_minutes(self, start: DateTime | None = None, end: DateTime | None = None) -> int:
+        """Minutes at least one office is open between two UTC instants"""
+        return self._minutes(self.covered_totals, start, end)
+
+    def uncovered_minutes(self, client: Client, start: DateTime | None = None, end: DateTime | None = None) -> int:
+        """Minutes a client needs support with no office open between two UTC instants"""
+        return self._minutes(self.uncovered_totals[client], start, end)
+
+    def coverage(self, d: Date) -> dict[Office, np.ndarray]:
+        """The time blocks of each office and client on a specific date"""
+        start = DateTime.combine(d, Time(), tzinfo=UTC)
+        time_range = slice(self.time_block(start), self.time_block(start.add(days=1)))
+        return {
+            office: blocks[time_range]
+            for office, blocks in self.office_time_blocks.items()
+        }
+
+    def print_coverage(self, d: Date):
         """Print the coverage for a specific date, formatted as in the problem statement"""
         day_of_week = d.format('dddd')
         date_string = d.format('DD MMMM YYYY')
-        start = DateTime.combine(d, Time(), tzinfo=UTC)
-        end = start.add(days=1)
-        time_range = slice(time_block(start), time_block(end))
+        coverage = self.coverage(d)
         print(dedent(f'''\
         {day_of_week:<9}               Hour (UTC): 0 1 2 3 4 5 6 7 8 9 1 1 1 1 1 1 1 1 1 1 2 2 2 2 
         {date_string:<20}                                    0 1 2 3 4 5 6 7 8 9 0 1 2 3 
                                             | | | | | | | | | | | | | | | | | | | | | | | | 
         ''').rstrip('\n'))
-        for office in offices:
+        for office in self.offices:
             print(f'{office.name[17:]:>35} ', end='')
             print(''.join(
                 'S' if tb else ' '
-                for tb in office_time_blocks[office][time_range]
+                for tb in coverage[office]
             ))
         print('                                    | | | | | | | | | | | | | | | | | | | | | | | | ')
-        for client in customers:
+        for client in self.customers:
             print(f'{client.name:>35} ', end='')
             print(''.join(
                 'R' if tb else ' '
-                for tb in office_time_blocks[client][time_range]
+                for tb in coverage[client]
             ))
 
+
+def solve(filename, year: int = 2022):
+    offices, customers = load(filename)
+    index = CoverageIndex(offices, customers, year)
     overtime = {
-        customer: sum(
-            30
-            for covered, support_required in zip(covered_time_blocks, office_time_blocks[customer])
-            if support_required and not covered
-        )
+        customer: index.uncovered_minutes(customer)
         for customer in customers
     }
     return max(overtime.values()) - min(overtime.values())
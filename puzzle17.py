@@ -1,6 +1,8 @@
-from itertools import pairwise
-from textwrap import wrap
-from typing import Iterable, Sequence
+import binascii
+import mmap
+import os
+from collections import defaultdict
+from typing import Iterable, Iterator
 
 DEBUG = False
 
@@ -22,24 +24,226 @@ bottom = set('╚╝═-')
 left = set('╔╚║|')
 right = set('╗╝║|')
 
-type Chunk = Sequence[bytes]
 
+class Chunk(tuple[memoryview, ...]):
+    """
+    The rows of one map chunk
+
+    Chunks are compared by identity, since their rows are views into a writable buffer and so can't be hashed.
+    """
+    __hash__ = object.__hash__
+    __eq__ = object.__eq__
+
+
+type Edges = tuple[tuple[int, ...], tuple[int, ...]]
+
+
+def load(filename: str, block_size: int = 1 << 20) -> list[Chunk]:
+    """
+    Load the map chunks, hex-decoding the file in large blocks of lines straight out of a memory map
+
+    Each row of a chunk is a memoryview into the one decoded buffer, rather than its own bytes object.
+
+    :param filename: The hex dump of the chunks
+    :param block_size: Approximate number of hex characters to decode at once
+    """
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            # mmap can't map an empty file
+            return []
+        # Each byte takes at least two hex digits, so this is big enough for the whole file
+        buffer = bytearray(size // 2)
+        view = memoryview(buffer)
+        row_lengths = []
+        end = 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as hex_text:
+            start = 0
+            while start < size:
+                # Blocks end on a line break, so no byte is split between them
+                stop = hex_text.find(b'\n', start + block_size)
+                stop = size if stop == -1 else stop + 1
+                block = hex_text[start:stop]
+                row_lengths.extend(len(line.strip()) // 2 for line in block.splitlines())
+                decoded = binascii.unhexlify(block.translate(None, b' \t\r\n'))
+                view[end:end + len(decoded)] = decoded
+                end += len(decoded)
+                start = stop
+        view.release()
+    del buffer[end:]
+    data = memoryview(buffer).toreadonly()
+    chunks = []
+    chunk = []
+    start = 0
+    # Blank lines separate the chunks
+    for length in row_lengths + [0]:
+        if length:
+            chunk.append(data[start:start + length])
+            start += length
+        elif chunk:
+            chunks.append(Chunk(chunk))
+            chunk = []
+    return chunks
+
+
+def leading_continuations(line: bytes, start: int = 0) -> int:
+    """Count the UTF-8 continuation bytes at the start of a line (or from an offset)"""
+    count = 0
+    while count < 3 and start + count < len(line) and line[start + count] & 0xC0 == 0x80:
+        count += 1
+    return count
+
+
+def continuation_needed(line: bytes, end: int | None = None) -> int:
+    """Count the continuation bytes needed to finish the character cut off at the end of a line (or at an offset)"""
+    if end is None:
+        end = len(line)
+    for back in range(1, min(4, end) + 1):
+        byte = line[end - back]
+        if byte & 0xC0 != 0x80:
+            length = 1 if byte < 0x80 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return max(length - back, 0)
+    return 0
+
+
+def chunk_edges(chunk: Chunk) -> Edges:
+    """The UTF-8 state at the left and right edge of each row of a chunk"""
+    return (
+        tuple(leading_continuations(line) for line in chunk),
+        tuple(continuation_needed(line) for line in chunk),
+    )
+
+
+def row_text(line: bytes) -> str:
+    """Decode one row of a chunk, marking any cut-off characters as invalid"""
+    return bytes(line).decode(errors='replace')
+
+
+class EdgeIndex:
+    """
+    Every chunk, indexed by the UTF-8 state down its left and right edges and by which map borders it could sit on
+
+    Chunks are filed under every prefix of each edge, so that when only some of the rows beside
+    a position are in place, the chunks that join up with them are found exactly.
+    """
+
+    def __init__(self, chunks: Iterable[Chunk]):
+        self.by_lead_prefix: dict[tuple[int, ...], set[Chunk]] = defaultdict(set)
+        self.by_lead: dict[tuple[int, ...], set[Chunk]] = defaultdict(set)
+        self.by_need_prefix: dict[tuple[int, ...], set[Chunk]] = defaultdict(set)
+        self.by_need: dict[tuple[int, ...], set[Chunk]] = defaultdict(set)
+        self.left_border: set[Chunk] = set()
+        self.right_border: set[Chunk] = set()
+        self.top_border: set[Chunk] = set()
+        self.bottom_border: set[Chunk] = set()
+        self.edges: dict[Chunk, Edges] = {}
+        self.max_height = 0
+        for chunk in chunks:
+            self.edges[chunk] = chunk_edges(chunk)
+            self.max_height = max(self.max_height, len(chunk))
+            for group in self.memberships(chunk):
+                group.add(chunk)
+
+    def memberships(self, chunk: Chunk) -> Iterator[set[Chunk]]:
+        """Every set the chunk belongs in"""
+        leads, needs = self.edges[chunk]
+        for length in range(1, len(leads) + 1):
+            yield self.by_lead_prefix[leads[:length]]
+            yield self.by_need_prefix[needs[:length]]
+        yield self.by_lead[leads]
+        yield self.by_need[needs]
+        rows = [row_text(line) for line in chunk]
+        # A chunk on the left or right border can't have a character cut off on that side
+        if not any(leads) and all(text[0] in left | {' '} for text in rows):
+            yield self.left_border
+        if not any(needs) and all(text[-1] in right | {' '} for text in rows):
+            yield self.right_border
+        # Characters cut off at either end of a row are checked once the neighbours are in place
+        if set(rows[0].strip(INVALID)) - {' '} <= top and '═' in rows[0]:
+            yield self.top_border
+        if set(rows[-1].strip(INVALID)) - {' '} <= bottom and '═' in rows[-1]:
+            yield self.bottom_border
+
+    @staticmethod
+    def joining(
+            by_prefix: dict[tuple[int, ...], set[Chunk]],
+            by_edge: dict[tuple[int, ...], set[Chunk]],
+            states: tuple[int, ...],
+    ) -> set[Chunk]:
+        """Find the chunks whose edge starts with the given UTF-8 states, or is all of a prefix of them"""
+        found = set(by_prefix.get(states, ()))
+        for length in range(1, len(states)):
+            found.update(by_edge.get(states[:length], ()))
+        return found
+
+    def candidates(self, treasure_map: 'TreasureMap', column: int) -> set[Chunk] | None:
+        """
+        Find the chunks that join up with whatever is already either side of the gap at the top of a column,
+        and with the map borders
 
-def load(filename: str) -> list[Chunk]:
-    with open(filename) as f:
-        def parse_chunk(lines):
-            return tuple(
-                bytes([
-                    int(byte, 16)
-                    for byte in wrap(line, 2)
-                ])
-                for line in lines
+        Chunks are found whether or not they have been placed already. If nothing constrains the gap yet, return None.
+        A chunk that could sit on a border only goes on that border, and one that couldn't never does.
+        """
+        heights = treasure_map.heights
+        row = heights[column]
+        col = column * CHUNK_WIDTH
+        rows = range(row, min(row + self.max_height, treasure_map.height))
+        found = None
+        if column == 0:
+            found = self.left_border
+        elif heights[column - 1] > row:
+            leads = tuple(
+                continuation_needed(treasure_map.line(i), col)
+                for i in rows[:heights[column - 1] - row]
             )
+            found = self.joining(self.by_lead_prefix, self.by_lead, leads)
+        end = col + CHUNK_WIDTH
+        beside = None
+        if end == treasure_map.width:
+            beside = self.right_border
+        elif heights[column + 1] > row:
+            needs = tuple(
+                leading_continuations(treasure_map.line(i), end)
+                for i in rows[:heights[column + 1] - row]
+            )
+            beside = self.joining(self.by_need_prefix, self.by_need, needs)
+        if beside is not None:
+            found = beside if found is None else found & beside
+        if row == 0:
+            found = self.top_border if found is None else found & self.top_border
+        if found is None:
+            return None
+        return {
+            chunk
+            for chunk in found
+            if (row + len(chunk) == treasure_map.height) == (chunk in self.bottom_border)
+            and (row == 0) == (chunk in self.top_border)
+            and (column == 0) == (chunk in self.left_border)
+            and (end == treasure_map.width) == (chunk in self.right_border)
+        }
+
 
-        return [
-            parse_chunk(ch.splitlines())
-            for ch in f.read().split('\n\n')
-        ]
+def fits(edges: Edges, treasure_map: 'TreasureMap', row: int, col: int) -> bool:
+    """Check that every row of a chunk joins up with its neighbours and the map border"""
+    leads, needs = edges
+    if row + len(leads) > treasure_map.height:
+        return False
+    end = col + CHUNK_WIDTH
+    for i, lead, need in zip(range(row, treasure_map.height), leads, needs):
+        line = treasure_map.line(i)
+        if line[col] != EMPTY:
+            return False
+        if col == 0:
+            if lead:
+                return False
+        elif line[col - 1] != EMPTY and continuation_needed(line, col) != lead:
+            return False
+        if end == len(line):
+            if need:
+                return False
+        elif line[end] != EMPTY and leading_continuations(line, end) != need:
+            return False
+    return True
 
 
 def check_line(line: str):
@@ -50,51 +254,101 @@ def check_line(line: str):
     return True
 
 
-def check(lines):
-    if DEBUG:
-        print('Checking map:')
-        print_map(lines)
-    try:
-        printable: list[str] = [
-            line.decode(errors='replace')
-            for line in lines
-        ]
-        assert all(map(check_line, printable)), 'Invalid character in middle of a line'
-        assert set(printable[0]) - {' '} <= top, 'Non-top characters in first line'
-        assert set(printable[-1]) - {' '} <= bottom, 'Non-bottom characters in last line'
-        assert set(line[0] for line in printable) - {' '} <= left, 'Non-left characters in first column'
-        assert set(line[-1] for line in printable) - {' '} <= right, 'Non-right characters in last column'
-    except AssertionError as e:
-        if DEBUG:
-            print('Failure:', e)
-        return False
-    return True
+class TreasureMap:
+    """
+    A map being pieced together, held in one preallocated bytearray
+
+    Pieces are written in place and can be taken back with undo(), so the search never copies the map.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.data = bytearray([EMPTY]) * (width * height)
+        # Number of rows filled in each column of chunks
+        self.heights = [0] * (width // CHUNK_WIDTH)
+        self.placed: list[tuple[Chunk, int, int]] = []
+        # Indexes into placed of the pieces in each column, from the top down
+        self.columns: list[list[int]] = [[] for _ in self.heights]
+        # Changes whenever a column gains or loses a piece, so work based on it can be cached
+        self.versions = [0] * len(self.heights)
+        self.changes = 0
+
+    def line(self, row: int) -> memoryview:
+        start = row * self.width
+        return memoryview(self.data)[start:start + self.width]
 
+    def lines(self) -> list[bytes]:
+        return [bytes(self.line(row)) for row in range(self.height)]
 
-def place(piece: Iterable[bytes], treasure_map: list[bytes], row: int, col: int) -> list[bytes]:
-    new_map = treasure_map.copy()
-    for i, line in enumerate(piece, start=row):
-        map_row = list(new_map[i])
-        map_row[col:col + len(line)] = list(line)
-        new_map[i] = bytes(map_row)
-    return new_map
+    def place(self, piece: Chunk, row: int, col: int):
+        for i, line in enumerate(piece, start=row):
+            start = i * self.width + col
+            self.data[start:start + len(line)] = line
+        column = col // CHUNK_WIDTH
+        self.heights[column] += len(piece)
+        self.columns[column].append(len(self.placed))
+        self.placed.append((piece, row, col))
+        self.changes += 1
+        self.versions[column] = self.changes
+
+    def undo(self) -> Chunk:
+        """Take back the most recently placed piece"""
+        piece, row, col = self.placed.pop()
+        for i, line in enumerate(piece, start=row):
+            start = i * self.width + col
+            self.data[start:start + len(line)] = bytes([EMPTY]) * len(line)
+        column = col // CHUNK_WIDTH
+        self.heights[column] -= len(piece)
+        self.columns[column].pop()
+        self.changes += 1
+        self.versions[column] = self.changes
+        return piece
+
+    def check_placed(self, row: int, col: int, height: int) -> bool:
+        """
+        Validate only the rows and columns touched by a piece placed at the given position
+
+        Each row is decoded from the start of the chunk to the left to the end of the chunk
+        to the right, which covers both joins. The map border is only checked where the piece touches it.
+        """
+        start = max(col - CHUNK_WIDTH, 0)
+        end = min(col + 2 * CHUNK_WIDTH, self.width)
+        try:
+            for i in range(row, row + height):
+                line = self.line(i)
+                assert check_line(line[start:end].tobytes().decode(errors='replace')), \
+                    'Invalid character in middle of a line'
+                if col == 0:
+                    assert line[:4].tobytes().decode(errors='replace')[0] in left | {' '}, \
+                        'Non-left characters in first column'
+                if col + CHUNK_WIDTH == self.width:
+                    assert line[-4:].tobytes().decode(errors='replace')[-1] in right | {' '}, \
+                        'Non-right characters in last column'
+            if row == 0:
+                assert set(self.line(0).tobytes().decode(errors='replace')) - {' '} <= top, \
+                    'Non-top characters in first line'
+            if row + height == self.height:
+                assert set(self.line(self.height - 1).tobytes().decode(errors='replace')) - {' '} <= bottom, \
+                    'Non-bottom characters in last line'
+        except AssertionError as e:
+            if DEBUG:
+                print('Failure:', e)
+            return False
+        return True
 
 
 def solve(filename: str):
     chunks = load(filename)
     if DEBUG:
         print(f'Piecing together map with {len(chunks)} pieces')
-    start = next(chunk for chunk in chunks if chunk[0].startswith(top_left))
-    map_width_in_chunks = sum(1 for chunk in chunks if horizontal_edge in chunk[0])
+    start = next(chunk for chunk in chunks if chunk[0][:len(top_left)] == top_left)
+    map_width_in_chunks = sum(1 for chunk in chunks if horizontal_edge in chunk[0].tobytes())
     map_width = map_width_in_chunks * CHUNK_WIDTH
     map_height = sum(len(chunk) for chunk in chunks) // map_width_in_chunks
-    empty_map = [
-        bytes([EMPTY] * map_width)
-        for _ in range(map_height)
-    ]
-    treasure_map = place(start, empty_map, 0, 0)
+    treasure_map = TreasureMap(map_width, map_height)
+    treasure_map.place(start, 0, 0)
     pieces = set(chunks.copy()) - {start}
-    check(treasure_map)
     solution = [
         line.decode()
         for line in try_solve(treasure_map, pieces, map_width)
@@ -108,50 +362,126 @@ def solve(filename: str):
     )
 
 
-def print_map(treasure_map: list[bytes]):
-    treasure_map = [line.decode(errors='replace') for line in treasure_map]
-    while not treasure_map[-1]:
-        treasure_map.pop()
-    print('*' * (len(treasure_map[0]) + 2))
-    for line in treasure_map:
-        print('*' + line + '*')
-    print('*' * (len(treasure_map[0]) + 2))
-
-
 def try_solve(
-        treasure_map: list[bytes],
+        treasure_map: TreasureMap,
         pieces: set[Chunk],
         map_width: int,
 ) -> list[bytes] | None:
     """
-    Iteratively try to piece the map together
+    Piece the map together with a backtracking search
+
+    Each step fills the gap at the top of whichever column has the fewest pieces that join up with
+    the neighbours already in place, so a column that has run out of options is found straight away.
+    Only columns near the lowest one are considered, so the map grows as a band rather than racing ahead
+    in a few columns, and the pieces checked against the most rows of their neighbours are tried first.
+    On a dead end, the search jumps back to the latest placement that could have caused it, rather than
+    the latest placement of all, which is often in some unrelated column.
 
     :param treasure_map: The part of the map already pieced together
     :param pieces: Pieces to assemble
     :param map_width: Edge width of map, in bytes
     :return: The completed treasure map
     """
-    if not pieces:
-        return treasure_map
-
-    # Find first incomplete row
-    r = next(
-        i
-        for i, line in enumerate(treasure_map)
-        if b' ' in line
-    )
-    c = next(
-        i if b == EMPTY else i - CHUNK_WIDTH
-        for i, (a, b) in enumerate(pairwise(treasure_map[r]), start=1)
-        if (a == EMPTY) ^ (b == EMPTY)
-    )
+    index = EdgeIndex(pieces)
+    unplaced = set(pieces)
+    # Placements made before the search started are fixed
+    fixed = len(treasure_map.placed)
+    placed_at: dict[Chunk, int] = {}
+    # Rows above the lowest column that a gap can be chosen from
+    band = 8
+    cache: dict[int, tuple[tuple[int, ...], list[Chunk] | None]] = {}
+
+    def compatible(column: int) -> list[Chunk] | None:
+        """Pieces, placed or not, that fit the gap at the top of a column, or None if anything could"""
+        key = tuple(treasure_map.versions[max(column - 1, 0):column + 2])
+        if column in cache and cache[column][0] == key:
+            return cache[column][1]
+        row, col = treasure_map.heights[column], column * CHUNK_WIDTH
+        found = index.candidates(treasure_map, column)
+        if found is not None:
+            found = [piece for piece in found if fits(index.edges[piece], treasure_map, row, col)]
+        cache[column] = key, found
+        return found
+
+    def checked(column: int, piece: Chunk) -> int:
+        """How many rows of the neighbours a piece was checked against in the gap at the top of a column"""
+        heights = treasure_map.heights
+        row = heights[column]
+        count = 0
+        for neighbour in (column - 1, column + 1):
+            if 0 <= neighbour < len(heights):
+                count += min(len(piece), max(heights[neighbour] - row, 0))
+        return count
+
+    def choose() -> tuple[int, list[Chunk]]:
+        """Pick the open column near the bottom of the map with the fewest unplaced pieces to fill its gap"""
+        best = None
+        lowest = min(treasure_map.heights)
+        for column, row in enumerate(treasure_map.heights):
+            if row == treasure_map.height or (found := compatible(column)) is None:
+                continue
+            options = [piece for piece in found if piece in unplaced]
+            if not options:
+                return column, options
+            if row >= lowest + band:
+                continue
+            if best is None or (len(options), row) < (len(best[1]), treasure_map.heights[best[0]]):
+                best = column, options
+        column, options = best
+        # A short piece matching a few rows is far more likely to be a coincidence than a tall one matching many
+        options.sort(key=lambda piece: checked(column, piece), reverse=True)
+        return best
+
+    def culprits(column: int) -> set[int]:
+        """The placements that decide which pieces could fill the gap at the top of a column"""
+        levels = set()
+        for neighbour in range(max(column - 1, 0), min(column + 2, len(treasure_map.heights))):
+            levels.update(treasure_map.columns[neighbour])
+        levels.update(placed_at[piece] for piece in compatible(column) if piece not in unplaced)
+        return {level for level in levels if level >= fixed}
 
-    for piece in pieces:
-        # Place the piece, then check it. If it works, keep trying. If not, try the next piece
-        if check(new_map := place(piece, treasure_map, r, c)):
-            return try_solve(new_map, pieces - {piece}, map_width)
+    def take_back() -> Chunk:
+        piece = treasure_map.undo()
+        unplaced.add(piece)
+        del placed_at[piece]
+        return piece
 
-    return None
+    if not unplaced:
+        return treasure_map.lines()
+    # Iterative rather than recursive, so large maps don't hit the recursion limit.
+    # Each entry is (column, remaining options, placements blamed for earlier failures)
+    history = []
+    column, options = choose()
+    todo, blamed = iter(options), set()
+    while True:
+        for piece in todo:
+            # Place the piece, then check it. If it works, keep trying. If not, try the next piece
+            row, col = treasure_map.heights[column], column * CHUNK_WIDTH
+            treasure_map.place(piece, row, col)
+            if treasure_map.check_placed(row, col, len(piece)):
+                placed_at[piece] = len(treasure_map.placed) - 1
+                unplaced.remove(piece)
+                history.append((column, todo, blamed))
+                break
+            treasure_map.undo()
+            blamed = blamed | culprits(column)
+        else:
+            # Dead end: jump back to the latest placement that could be to blame and try its alternatives
+            blamed = blamed | culprits(column)
+            if not blamed:
+                return None
+            target = max(blamed)
+            while len(treasure_map.placed) > target + 1:
+                take_back()
+                history.pop()
+            take_back()
+            column, todo, earlier = history.pop()
+            blamed = earlier | (blamed - {target})
+            continue
+        if not unplaced:
+            return treasure_map.lines()
+        column, options = choose()
+        todo, blamed = iter(options), set()
 
 
 if __name__ == '__main__':
@@ -14,59 +14,80 @@ swap_parens = str.maketrans({'(': ')', ')': '('})
 remove_markers = str.maketrans({RLI: None, LRI: None, PDI: None})
 
 
+def divide(a, b):
+    """Exact division, which only leaves the integers when there's a remainder"""
+    if isinstance(a, int) and isinstance(b, int):
+        quotient, remainder = divmod(a, b)
+        if not remainder:
+            return quotient
+        return Fraction(a, b)
+    result = a / b
+    if result.denominator == 1:
+        return result.numerator
+    return result
+
+
+operators = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': divide,
+}
+# A number, or any other single character that isn't whitespace
+token_pattern = re.compile(r'(\d+)|(\S)')
+
+
 class Stack(list):
+    """A parenthesized group: operand, operator, operand, ... evaluated strictly left to right"""
+
     def __init__(self, parent=None):
         super().__init__()
         self.parent = parent
 
     @property
     def value(self):
-        tokens = self.copy()
-        assert len(tokens) % 2 == 1
-        while len(tokens) > 1:
-            a, op, b, *_ = tokens
-            assert isinstance(a, (Fraction, Stack))
-            assert isinstance(b, (Fraction, Stack))
+        assert len(self) % 2 == 1
+        result = operand_value(self[0])
+        for i in range(1, len(self), 2):
+            op = self[i]
             assert callable(op)
-            if isinstance(a, Stack):
-                a_val = a.value
-            else:
-                a_val = a
-            if isinstance(b, Stack):
-                b_val = b.value
-            else:
-                b_val = b
-            tokens[:3] = [op(a_val, b_val)]
-        return tokens[0]
+            result = op(result, operand_value(self[i + 1]))
+        return result
 
 
-def eval_expr(expr: str) -> int:
+def operand_value(operand):
+    assert isinstance(operand, (int, Fraction, Stack))
+    if isinstance(operand, Stack):
+        return operand.value
+    return operand
+
+
+def tokenize(expr: str):
+    """Yield each number and symbol in an expression, in a single pass over the string"""
+    for match in token_pattern.finditer(expr):
+        number, symbol = match.groups()
+        yield number or symbol
+
+
+def parse(expr: str) -> Stack:
     stack = Stack()
-    operators = {
-        '+': operator.add,
-        '-': operator.sub,
-        '*': operator.mul,
-        '/': operator.truediv,
-    }
-    remaining = expr
-    while remaining:
-        if match := re.match(r'\d+', remaining):
-            stack.append(Fraction(match.group()))
-            remaining = remaining[match.end():]
+    for token in tokenize(expr):
+        if token == '(':
+            new_stack = Stack(parent=stack)
+            stack.append(new_stack)
+            stack = new_stack
+        elif token == ')':
+            stack = stack.parent
+        elif token in operators:
+            stack.append(operators[token])
         else:
-            token = remaining[0]
-            remaining = remaining[1:]
-            if token.isspace():
-                continue
-            elif token == '(':
-                new_stack = Stack(parent=stack)
-                stack.append(new_stack)
-                stack = new_stack
-            elif token == ')':
-                stack = stack.parent
-            else:
-                stack.append(operators[token])
-    return stack.value
+            # Plain ints are much cheaper than Fractions, and exact until a division has a remainder
+            stack.append(int(token))
+    return stack
+
+
+def eval_expr(expr: str) -> int:
+    return parse(expr).value
 
 
 def eval_rex(equation: str) -> int:
@@ -92,31 +113,53 @@ def eval_lynx(equation: str) -> int:
             current_direction = ({LRI, RLI} - {current_direction}).pop()
         else:
             embedded_levels.append(current_level)
-    flip_levels: range = range(1, 1 + max(embedded_levels))[::-1]
-
-    def find_ranges(threshold: int) -> list[slice]:
-        nonlocal embedded_levels
-        ranges = []
-        start, end = None, None
-        for i, level in enumerate(embedded_levels):
-            if level >= threshold:
-                end = i
-                if start is None:
-                    start = i
-            elif start is not None:
-                if start != end:
-                    ranges.append(slice(start, end + 1))
-                start = end = None
-        return ranges
-
-    for flip in flip_levels:
-        for r in find_ranges(flip):
-            equation = (
-                    equation[:r.start] +
-                    equation[r][::-1].translate(swap_parens) +
-                    equation[r.stop:]
-            )
-    return eval_expr(equation.translate(remove_markers))
+    return eval_expr(reorder(equation, embedded_levels).translate(remove_markers))
+
+
+class Run(list):
+    """The positions (and nested runs) in a stretch of text at or above an embedding level"""
+
+    def __init__(self, level: int, start: int):
+        super().__init__()
+        self.level = level
+        self.start = start
+        # Set once the run is closed, since runs of one character or at the very end are left alone
+        self.reverse = False
+
+
+def reorder(text: str, embedded_levels: list[int]) -> str:
+    """
+    From the highest level down, reverse every run of characters at that level or higher
+
+    Rather than rewriting the text once per run per level, the nested runs are found in one sweep,
+    and the text is emitted in its final order in a second: each run is walked backwards when it
+    has been reversed an odd number of times, counting the runs that enclose it.
+    """
+    root = Run(0, 0)
+    open_runs = [root]
+    for i, level in enumerate(embedded_levels):
+        while open_runs[-1].level > level:
+            run = open_runs.pop()
+            run.reverse = i - run.start > 1
+        while open_runs[-1].level < level:
+            run = Run(open_runs[-1].level + 1, i)
+            open_runs[-1].append(run)
+            open_runs.append(run)
+        open_runs[-1].append(i)
+
+    reordered = []
+    todo = [(iter(root), False)]
+    while todo:
+        items, flipped = todo[-1]
+        for item in items:
+            if isinstance(item, Run):
+                reverse = flipped ^ item.reverse
+                todo.append((reversed(item) if reverse else iter(item), reverse))
+                break
+            reordered.append(text[item].translate(swap_parens) if flipped else text[item])
+        else:
+            todo.pop()
+    return ''.join(reordered)
 
 
 def solve(filename: str):
@@ -1,13 +1,27 @@
-from collections import defaultdict
+import mmap
+import posixpath
+import stat
+import struct
+import tarfile
+import zipfile
 from datetime import datetime
+from io import BytesIO
 from pathlib import Path
 from string import Template
 from typing import Generator
 from zoneinfo import ZoneInfo
 
+import numpy as np
+
 TZ_TEMPLATE = Template(str(Path(__file__).parent / '$version/usr/share/zoneinfo/$tz'))
+# Built by get-zoneinfo.sh, and used instead of the installed tree when present
+ARCHIVE_TEMPLATES = [
+    Template(str(Path(__file__).parent / 'zoneinfo-$version.tar')),
+    Template(str(Path(__file__).parent / 'zoneinfo-$version.zip')),
+]
 VERSIONS = ['2018c', '2018g', '2021b', '2023d']
 UTC = ZoneInfo('UTC')
+DAY = 86400
 
 
 def parse_input(filename: str) -> Generator[tuple[datetime, str], None, None]:
@@ -17,28 +31,267 @@ def parse_input(filename: str) -> Generator[tuple[datetime, str], None, None]:
             yield datetime.fromisoformat(dt), tz
 
 
-def load_zone_info(version: str, tz: str):
+def read_zone_file(version: str, tz: str) -> bytes:
     filename = TZ_TEMPLATE.substitute(version=version, tz=tz)
     with open(filename, 'rb') as f:
-        return ZoneInfo.from_file(f)
+        return f.read()
+
+
+def load_zone_info(version: str, tz: str):
+    return ZoneInfo.from_file(BytesIO(read_zone_file(version, tz)))
+
+
+def zone_key(member_name: str) -> str:
+    """The IANA name of an archive member, whether or not it was archived with its install path"""
+    name = posixpath.normpath(member_name.lstrip('./'))
+    _, found, key = name.rpartition('zoneinfo/')
+    return key if found else name
+
+
+class ZoneArchive:
+    """
+    Compiled zones for one tzdb version, read straight out of an uncompressed tar or a zip
+
+    Nothing is extracted. A tar is memory-mapped and zones are sliced out of the map directly,
+    while zip members are decompressed on demand.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.zip = None
+        self.members: dict[str, tuple[int, int]] = {}
+        if zipfile.is_zipfile(self.file):
+            self.zip = zipfile.ZipFile(self.file)
+            infos = {posixpath.normpath(info.filename): info for info in self.zip.infolist()}
+            self.names = {}
+            for info in infos.values():
+                target = info
+                # Symbolic links are stored as members holding the path they point to
+                while target is not None and stat.S_ISLNK(target.external_attr >> 16):
+                    link = self.zip.read(target).decode()
+                    target = infos.get(posixpath.normpath(posixpath.join(posixpath.dirname(target.filename), link)))
+                if target is not None and not target.is_dir():
+                    self.names[zone_key(info.filename)] = target.filename
+        else:
+            with tarfile.open(fileobj=self.map, mode='r:') as tar:
+                members = tar.getmembers()
+            files = {posixpath.normpath(member.name): member for member in members}
+            for member in members:
+                target = member
+                # zic installs links between zones, which may be archived as hard or symbolic links
+                while target is not None and (target.islnk() or target.issym()):
+                    if target.issym():
+                        link = posixpath.normpath(posixpath.join(posixpath.dirname(target.name), target.linkname))
+                    else:
+                        link = posixpath.normpath(target.linkname)
+                    target = files.get(link)
+                if target is not None and target.isfile():
+                    self.members[zone_key(member.name)] = target.offset_data, target.size
+
+    def read(self, tz: str) -> bytes:
+        if self.zip is not None:
+            return self.zip.read(self.names[tz])
+        offset, size = self.members[tz]
+        return self.map[offset:offset + size]
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+        self.map.close()
+        self.file.close()
+
+
+class ZoneProvider:
+    """
+    Zones for several tzdb versions, from archives where available and installed trees otherwise
+
+    A zone whose compiled data is the same in several versions is only parsed once.
+    """
+
+    def __init__(self, versions: list[str]):
+        self.archives: dict[str, ZoneArchive] = {}
+        for version in versions:
+            for template in ARCHIVE_TEMPLATES:
+                path = Path(template.substitute(version=version))
+                if path.exists():
+                    self.archives[version] = ZoneArchive(str(path))
+                    break
+        self.zone_infos: dict[bytes, ZoneInfo] = {}
+        self.tables: dict[bytes, TransitionTable] = {}
+
+    def read(self, version: str, tz: str) -> bytes:
+        if version in self.archives:
+            return self.archives[version].read(tz)
+        return read_zone_file(version, tz)
+
+    def zone_info(self, version: str, tz: str) -> ZoneInfo:
+        data = self.read(version, tz)
+        if data not in self.zone_infos:
+            self.zone_infos[data] = ZoneInfo.from_file(BytesIO(data))
+        return self.zone_infos[data]
+
+    def table(self, version: str, tz: str) -> 'TransitionTable':
+        data = self.read(version, tz)
+        if data not in self.tables:
+            self.tables[data] = TransitionTable.from_tzif(data, self.zone_info(version, tz))
+        return self.tables[data]
+
+    def close(self):
+        for archive in self.archives.values():
+            archive.close()
+
+
+class TransitionTable:
+    """
+    The offset changes of one time zone, as arrays that can convert many local times at once
+
+    Conversions match ``local_time.replace(tzinfo=zone).astimezone(UTC)``, including the
+    handling of skipped and repeated local times.
+    """
+
+    def __init__(
+            self,
+            zone: ZoneInfo,
+            transitions: np.ndarray,
+            offsets: np.ndarray,
+            before: int,
+            has_rule: bool = True,
+    ):
+        """
+        :param zone: The zone, used to work out transitions after the end of the table
+        :param transitions: UTC timestamps of each transition
+        :param offsets: UTC offset in seconds from each transition onwards
+        :param before: UTC offset in seconds before the first transition
+        :param has_rule: Whether the zone keeps changing offset after the end of the table
+        """
+        self.zone = zone
+        self.transitions = transitions
+        self.offsets = offsets
+        self.before = before
+        self.has_rule = has_rule and len(transitions) > 0
+        self.extended_until = int(transitions[-1]) if len(transitions) else 0
+
+    @classmethod
+    def from_tzif(cls, data: bytes, zone: ZoneInfo | None = None):
+        """Read the transition table out of compiled TZif data"""
+        header = struct.Struct('>4sc15x6l')
+        magic, version, isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = header.unpack_from(data)
+        assert magic == b'TZif', 'Not a TZif file'
+        time_size = 4
+        offset = header.size
+        if version >= b'2':
+            # Skip the 32-bit data block in favour of the 64-bit one that follows it
+            offset += timecnt * 5 + typecnt * 6 + charcnt + leapcnt * 8 + isstdcnt + isutcnt
+            magic, version, isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = header.unpack_from(data, offset)
+            offset += header.size
+            time_size = 8
+        transitions = np.frombuffer(data, dtype=f'>i{time_size}', count=timecnt, offset=offset).astype(np.int64)
+        offset += timecnt * time_size
+        type_indices = np.frombuffer(data, dtype=np.uint8, count=timecnt, offset=offset)
+        offset += timecnt
+        types = [struct.unpack_from('>lBB', data, offset + 6 * i) for i in range(typecnt)]
+        offset += typecnt * 6 + charcnt + leapcnt * (time_size + 4) + isstdcnt + isutcnt
+        # Version 2+ files end with a POSIX TZ string, which only has a comma if there's daylight saving
+        footer = data[offset:].strip() if time_size == 8 else b''
+        type_offsets = np.array([utoff for utoff, _, _ in types], dtype=np.int64)
+        # Same rule as zoneinfo: before the first transition, use the first standard time type
+        before = next((utoff for utoff, isdst, _ in types if not isdst), type_offsets[0])
+        if zone is None:
+            zone = ZoneInfo.from_file(BytesIO(data))
+        return cls(zone, transitions, type_offsets[type_indices], int(before), b',' in footer)
+
+    def _offset_at(self, timestamp: int) -> int:
+        return int(datetime.fromtimestamp(timestamp, self.zone).utcoffset().total_seconds())
+
+    def extend(self, until: int):
+        """
+        Add the transitions from the end of the table until the given UTC timestamp
+
+        These come from the TZ rule in the file's footer, which the zone applies for us.
+        The zone is sampled daily, and each change is narrowed down to the second.
+        """
+        if not self.has_rule or until <= self.extended_until:
+            return
+        start = self.extended_until
+        self.extended_until = until
+        new_transitions = []
+        new_offsets = []
+        previous = self._offset_at(start)
+        t = start
+        while t < until:
+            step = min(t + DAY, until)
+            current = self._offset_at(step)
+            if current != previous:
+                low, high = t, step
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if self._offset_at(middle) == previous:
+                        low = middle
+                    else:
+                        high = middle
+                new_transitions.append(high)
+                new_offsets.append(current)
+                previous = current
+            t = step
+        if new_transitions:
+            self.transitions = np.concatenate((self.transitions, new_transitions))
+            self.offsets = np.concatenate((self.offsets, new_offsets))
+
+    def to_utc(self, local: np.ndarray) -> np.ndarray:
+        """
+        Convert naive local timestamps (seconds since 1970, wall clock) to UTC timestamps
+
+        Every timestamp is resolved with one binary search over the transitions, as seen on the
+        wall clock. When a local time is repeated, the first one is used, and a skipped local
+        time uses the offset from before the transition, just as with fold=0.
+        """
+        if not len(local):
+            return local.copy()
+        # The most a zone can be ahead of UTC is 14 hours, so this covers every local time given
+        self.extend(int(local.max()) + DAY)
+        if not len(self.transitions):
+            return local - self.before
+        previous = np.concatenate(([self.before], self.offsets[:-1]))
+        wall = self.transitions + np.maximum(previous, self.offsets)
+        index = np.searchsorted(wall, local, side='right') - 1
+        offsets = np.where(index >= 0, self.offsets[np.maximum(index, 0)], self.before)
+        return local - offsets
+
+
+def to_timestamps(times: list[datetime]) -> np.ndarray:
+    """Naive datetimes as seconds since 1970"""
+    return np.array(times, dtype='datetime64[s]').astype(np.int64)
 
 
 def solve(filename: str):
     times = list(parse_input(filename))
-    iana_names = {iana for _, iana in times}
-    zone_infos = {
-        (version, iana): load_zone_info(version, iana)
+    iana_names = sorted({iana for _, iana in times})
+    provider = ZoneProvider(VERSIONS)
+    tables = {
+        (version, iana): provider.table(version, iana)
         for version in VERSIONS
         for iana in iana_names
     }
-    utc_times: dict[datetime, set[str]] = defaultdict(set)
-    for local_time, iana_name in times:
-        for version in VERSIONS:
-            tz = zone_infos[version, iana_name]
-            utc_time = local_time.replace(tzinfo=tz).astimezone(UTC)
-            utc_times[utc_time].add(iana_name)
-    result = max(utc_times, key=lambda t: len(utc_times[t]))
-    return result.isoformat()
+    provider.close()
+    local = to_timestamps([local_time for local_time, _ in times])
+    zone_ids = np.searchsorted(iana_names, [iana for _, iana in times])
+    utc_times = np.empty((len(times), len(VERSIONS)), dtype=np.int64)
+    # Convert every timestamp for one zone at a time
+    order = np.argsort(zone_ids, kind='stable')
+    for zone_id, rows in enumerate(np.split(order, np.cumsum(np.bincount(zone_ids, minlength=len(iana_names)))[:-1])):
+        for j, version in enumerate(VERSIONS):
+            utc_times[rows, j] = tables[version, iana_names[zone_id]].to_utc(local[rows])
+
+    # Count the distinct zones that land on each UTC time, however many versions agree
+    utc_times = utc_times.ravel()
+    pairs = np.unique(utc_times * len(iana_names) + np.repeat(zone_ids, len(VERSIONS)))
+    instants, counts = np.unique(pairs // len(iana_names), return_counts=True)
+    _, first_seen = np.unique(utc_times, return_index=True)
+    # Break ties in favour of the time that showed up first
+    best = counts == counts.max()
+    result = int(instants[best][np.argmin(first_seen[best])])
+    return datetime.fromtimestamp(result, UTC).isoformat()
 
 
 if __name__ == '__main__':